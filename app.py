@@ -1,92 +1,300 @@
 import ccxt
+import diskcache
+import functools
 import pandas as pd
 import numpy as np
-from scipy import stats
+import requests
 import streamlit as st
 import plotly.graph_objects as go
+import threading
 import time
+from requests.adapters import HTTPAdapter
+from streamlit_autorefresh import st_autorefresh
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Number of worker threads for the symbol scan (I/O-bound, so well above core count)
+MAX_WORKERS = 16
+
+# One shared HTTP session for every ccxt client: the pooled adapter
+# keeps TCP+TLS connections alive across calls and threads, so workers
+# skip the handshake on all but the first request per socket. urllib3's
+# pool manager is thread-safe. cache_resource keeps a single pool alive
+# across reruns — a module-level session would be rebuilt (and the old
+# pool leaked) every minute, starting each scan on cold sockets.
+class _SharedSession(requests.Session):
+    # ccxt's Exchange.__del__ calls session.close() when a client is
+    # GC'd — and the per-scan worker clients are collected after every
+    # scan. The session (and its warm sockets) outlives any one client,
+    # so closing must be a no-op; it lives for the process anyway.
+    def close(self):
+        pass
+
+@st.cache_resource
+def get_http_session():
+    sess = _SharedSession()
+    sess.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=2))
+    return sess
+
+_http_session = get_http_session()
 
 # Initialize Bitget futures exchange (public for OHLCV and OI)
-exchange = ccxt.bitget({
-    'options': {'defaultType': 'swap'},
-    'enableRateLimit': True
-})
+def make_exchange():
+    ex = ccxt.bitget({
+        'options': {'defaultType': 'swap'},
+        'enableRateLimit': True
+    })
+    ex.session = _http_session
+    return ex
+
+# Markets are loaded once per session instead of on every rerun — the
+# symbol list is static enough that a fresh REST call per render is waste.
+@st.cache_resource
+def get_exchange():
+    ex = make_exchange()
+    ex.load_markets()
+    return ex
+
+exchange = get_exchange()
+
+# One ccxt client per worker thread: ccxt's rate-limiter lock is per-instance,
+# so sharing a single client would serialize the parallel fetches again.
+_thread_local = threading.local()
+
+def get_thread_exchange():
+    ex = getattr(_thread_local, 'exchange', None)
+    if ex is None:
+        ex = make_exchange()
+        _thread_local.exchange = ex
+    return ex
+
+# Disk-backed candle/OI store so the per-minute autorefresh only fetches
+# the delta since the last stored candle instead of the full 4h window.
+# Values are compact float64 arrays: (ts, o, h, l, c, v) rows for OHLCV,
+# (ts, oi) rows for open interest. diskcache is SQLite-backed and safe
+# to hit from the worker threads.
+_ohlcv_cache = diskcache.Cache('.cache/ohlcv')
+_oi_cache = diskcache.Cache('.cache/oi')
+
+def _merge_delta(prior, new, limit):
+    # The last stored candle was still forming when cached, so the delta
+    # refetch starts at its timestamp and replaces it.
+    if new.size:
+        prior = np.concatenate([prior[prior[:, 0] < new[0, 0]], new])
+    return prior[-limit:]
+
+def fetch_ohlcv_cached(ex, symbol, limit):
+    arr = _ohlcv_cache.get(symbol)
+    now_ms = int(time.time() * 1000)
+    if arr is None or len(arr) == 0 or int(arr[-1, 0]) < now_ms - limit * 60_000:
+        # Cold or too stale to patch: fetch the whole window
+        arr = np.asarray(ex.fetch_ohlcv(symbol, '1m', limit=limit), dtype=np.float64).reshape(-1, 6)
+    else:
+        new = np.asarray(ex.fetch_ohlcv(symbol, '1m', since=int(arr[-1, 0]), limit=limit), dtype=np.float64)
+        arr = _merge_delta(arr, new, limit)
+    _ohlcv_cache.set(symbol, arr)
+    return arr
+
+def _oi_array(oi_1m):
+    # fromiter fills the arrays straight from the dicts — no intermediate
+    # list of Python floats
+    ts = np.fromiter((o['timestamp'] for o in oi_1m), dtype=np.float64, count=len(oi_1m))
+    vals = np.fromiter((o['open_interest'] for o in oi_1m), dtype=np.float64, count=len(oi_1m))
+    return np.column_stack((ts, vals))
+
+def fetch_oi_cached(ex, symbol, limit):
+    arr = _oi_cache.get(symbol)
+    now_ms = int(time.time() * 1000)
+    if arr is None or len(arr) == 0 or int(arr[-1, 0]) < now_ms - limit * 60_000:
+        arr = _oi_array(ex.fetch_open_interest_history(symbol, '1m', limit=limit))
+    else:
+        new = _oi_array(ex.fetch_open_interest_history(symbol, '1m', since=int(arr[-1, 0]), limit=limit))
+        arr = _merge_delta(arr, new, limit)
+    _oi_cache.set(symbol, arr)
+    return arr
+
+# In-process layer over the disk cache, keyed by (symbol, minute): the
+# 1m series can't change within a minute-bucket, so rapid reruns skip
+# both the HTTP delta call and the SQLite read. No TTL needed — the
+# minute in the key rolls over and old entries age out of the LRU.
+# The memoized closures live behind cache_resource: a bare module-level
+# lru_cache would be rebound (and emptied) by every script rerun.
+@st.cache_resource
+def get_minute_fetchers():
+    @functools.lru_cache(maxsize=2048)
+    def ohlcv_minute(symbol, limit, minute_bucket):
+        return fetch_ohlcv_cached(get_thread_exchange(), symbol, limit)
+
+    @functools.lru_cache(maxsize=2048)
+    def oi_minute(symbol, limit, minute_bucket):
+        return fetch_oi_cached(get_thread_exchange(), symbol, limit)
+
+    return ohlcv_minute, oi_minute
+
+_ohlcv_minute, _oi_minute = get_minute_fetchers()
 
-# Load perp USDT futures symbols (limit to 10 for testing; change to [:] for full)
-markets = exchange.load_markets()
-symbols = [m['symbol'] for m in markets.values() if m.get('perp') and m['quote'] == 'USDT'][:10]
+# Regressors for the two scan windows, built once instead of per scan:
+# the centered x and its sum of squares only depend on the window length
+_X_240 = np.arange(240, dtype=np.float64)
+_X_60 = np.arange(60, dtype=np.float64)
+_XC_240 = _X_240 - _X_240.mean()
+_XC_60 = _X_60 - _X_60.mean()
+_SXX_240 = _XC_240.dot(_XC_240)
+_SXX_60 = _XC_60.dot(_XC_60)
+
+def batch_slope_r(ys, xc, sxx):
+    """Least-squares slope and Pearson's R of each row of ys against x.
+
+    Closed-form version of scipy.stats.linregress, vectorized across
+    symbols: one (N, n) @ (n,) product per statistic instead of N
+    Python-level scipy calls per scan. xc is the mean-centered regressor
+    and sxx its sum of squares (precomputed above per window).
+    """
+    yc = ys - ys.mean(axis=1, keepdims=True)
+    sxy = yc.dot(xc)
+    syy = (yc * yc).sum(axis=1)
+    slope = sxy / sxx
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = sxy / np.sqrt(sxx * syy)
+    return slope, r
+
+# Illiquid perps never pass a realistic slope filter, so prune them with
+# one fetch_tickers call before paying two candle fetches per symbol
+MIN_QUOTE_VOLUME_24H = 5_000_000
+
+# Load liquid perp USDT futures symbols (limit to 10 for testing; change to [:] for full)
+@st.cache_data(ttl=300)
+def get_symbols(_exchange):
+    # Underscore prefix: tell Streamlit not to hash the ccxt client
+    perps = {m['symbol'] for m in _exchange.markets.values() if m.get('perp') and m['quote'] == 'USDT'}
+    tickers = _exchange.fetch_tickers()
+    return [s for s, t in tickers.items()
+            if s in perps and (t.get('quoteVolume') or 0) > MIN_QUOTE_VOLUME_24H][:10]
+
+symbols = get_symbols(exchange)
 
 # Function to fetch and compute data for a symbol (4 hours = 240 x 1m candles)
-@st.cache_data(ttl=60)  # Cache for 1 minute
-def get_symbol_data(symbol, num_1m_candles_4h=240, num_1m_candles_1h=60):
+# cache_resource instead of cache_data: the result is read-only, so the
+# pickle/hash round trip cache_data does on every hit is pure overhead.
+@st.cache_resource(ttl=60)  # Cache for 1 minute
+def get_symbol_data(symbol, num_1m_candles_4h=240):
+    """Fetch the raw 1m series for one symbol.
+
+    Pure I/O on purpose: every derived number (price, sums, slopes, R)
+    is computed in the vectorized pass on the main thread, so worker
+    threads spend their time in network waits with the GIL released.
+    """
     try:
-        # Fetch 1m candles for 4 hours
-        ohlcv_1m = exchange.fetch_ohlcv(symbol, '1m', limit=num_1m_candles_4h)
-        df_1m = pd.DataFrame(ohlcv_1m, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df_1m['timestamp'] = pd.to_datetime(df_1m['timestamp'], unit='ms')
-
-        # Aggregate recent 4h data
-        latest_1m = df_1m.iloc[-1]
-        agg_data = {
+        # Delta-patched fetches from the disk cache, memoized per minute.
+        # The scan only needs close/volume columns — timestamps only
+        # matter in the chart path.
+        minute_bucket = int(time.time() // 60)
+        ohlcv_1m = _ohlcv_minute(symbol, num_1m_candles_4h, minute_bucket)
+        oi_values = _oi_minute(symbol, num_1m_candles_4h, minute_bucket)[:, 1]
+
+        # Symbols without a full 4h history (new listings) are skipped so
+        # the stacked per-metric matrices stay rectangular.
+        if len(ohlcv_1m) < num_1m_candles_4h or len(oi_values) < num_1m_candles_4h:
+            return None
+
+        # float32 halves memory traffic during the stack/reduce pass —
+        # plenty of precision for R and slope-sign filtering
+        return {
             'symbol': symbol,
-            'price': latest_1m['close'],
-            'volume_4h': df_1m['volume'].sum(),
+            'closes': ohlcv_1m[:, 4].astype(np.float32),
+            'volumes': ohlcv_1m[:, 5].astype(np.float32),
+            'oi': oi_values[-num_1m_candles_4h:].astype(np.float32),
         }
-
-        # Fetch 1m open interest history for 4 hours
-        oi_1m = exchange.fetch_open_interest_history(symbol, '1m', limit=num_1m_candles_4h)
-        oi_values = [o['open_interest'] for o in oi_1m]
-        agg_data['oi_4h'] = oi_values[-1] if oi_values else np.nan
-
-        # Pearson's R for 1m price linear regression (over 4 hours)
-        closes = df_1m['close'].values
-        x = np.arange(len(closes))
-        if len(closes) >= 2:
-            slope, intercept, r, p, se = stats.linregress(x, closes)
-            agg_data['pearson_r'] = r
-        else:
-            agg_data['pearson_r'] = np.nan
-
-        # Slopes for volume and OI over past 1h and 4h
-        for period_hours, period_key, num_candles in [(1, '1h', num_1m_candles_1h), (4, '4h', num_1m_candles_4h)]:
-            volumes = df_1m['volume'].tail(num_candles).values
-            oi_period = oi_values[-num_candles:]
-
-            # Volume slope
-            if len(volumes) >= 2:
-                x_period = np.arange(len(volumes))
-                slope_vol, _, _, _, _ = stats.linregress(x_period, volumes)
-                agg_data[f'volume_slope_{period_key}'] = slope_vol
-            else:
-                agg_data[f'volume_slope_{period_key}'] = np.nan
-
-            # OI slope
-            if len(oi_period) >= 2:
-                x_period = np.arange(len(oi_period))
-                slope_oi, _, _, _, _ = stats.linregress(x_period, oi_period)
-                agg_data[f'oi_slope_{period_key}'] = slope_oi
-            else:
-                agg_data[f'oi_slope_{period_key}'] = np.nan
-
-        return agg_data
     except Exception as e:
-        st.write(f"Error fetching data for {symbol}: {str(e)}")  # Display error for debugging
-        return None  # Skip symbols with errors
+        # Worker threads have no ScriptRunContext, so st.write here would
+        # be silently dropped — hand the message back to the main thread
+        return {'symbol': symbol, 'error': str(e)}
+
+# Detailed 1m data for the chart view (24 hours = 1440 candles), cached
+# per symbol so reruns while a chart is open don't refetch it
+@st.cache_data(ttl=60)
+def fetch_chart_data(symbol, limit=1440):
+    ohlcv = exchange.fetch_ohlcv(symbol, '1m', limit=limit)
+    oi = exchange.fetch_open_interest_history(symbol, '1m', limit=limit)
+    return ohlcv, oi
+
+# Plotly chart: Candlestick + volume/OI. Cached per symbol so reruns
+# reuse the built figure instead of reassembling 1440-point traces.
+@st.cache_data(ttl=60)
+def build_chart(symbol):
+    ohlcv, oi = fetch_chart_data(symbol)
+    df_chart = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df_chart['timestamp'] = pd.to_datetime(df_chart['timestamp'], unit='ms')
+    df_chart['oi'] = np.fromiter((o['open_interest'] for o in oi), dtype=np.float64, count=len(oi))
+    # Downsample long histories to ~15m resolution — plenty for the
+    # zoomed-out view and a quarter of the client-side render cost
+    if len(df_chart) > 720:
+        df_chart = df_chart.iloc[::4]
+
+    fig = go.Figure()
+    fig.add_trace(go.Candlestick(x=df_chart['timestamp'], open=df_chart['open'], high=df_chart['high'], low=df_chart['low'], close=df_chart['close'], name='Price'))
+    # Scattergl: the volume/OI traces render via WebGL instead of SVG
+    # (the candlestick itself has no GL variant)
+    fig.add_trace(go.Scattergl(x=df_chart['timestamp'], y=df_chart['volume'], name='Volume', yaxis='y2', mode='lines', opacity=0.5))
+    fig.add_trace(go.Scattergl(x=df_chart['timestamp'], y=df_chart['oi'], name='OI', yaxis='y3', mode='lines'))
+    fig.update_layout(
+        title=f"{symbol} Chart",
+        yaxis_title='Price',
+        yaxis2=dict(title='Volume', overlaying='y', side='right'),
+        yaxis3=dict(title='OI', overlaying='y', side='left', anchor='free', position=0.05),
+        xaxis_rangeslider_visible=False
+    )
+    return fig
 
 # Streamlit UI
-st.title('Bitget Perp Futures Screener (1m Candles, Updates on Refresh)')
+st.title('Bitget Perp Futures Screener (1m Candles, Auto-Refreshes Every Minute)')
+
+# Rerun every minute so the scan tracks the newest candle
+st_autorefresh(interval=60_000, key='scan_refresh')
+
+# Staleness guard: widget-driven reruns (slider moves, symbol selects)
+# must not re-trigger the fetch loop — only the minute tick or an
+# explicit button press does.
+scan_is_stale = time.time() - st.session_state.get('last_scan', 0) > 60
+
+if st.button('Refresh Data') or scan_is_stale:
+    # Stamp at scan *start*: the autorefresh timer restarts after the
+    # rerun (scan included) finishes, so an end-of-scan stamp would leave
+    # the next tick right at the 60s edge and intermittently skipped.
+    st.session_state['last_scan'] = time.time()
 
-if st.button('Refresh Data'):
     # Scan and aggregate data with progress bar
     st.subheader('Scanning symbols...')
     progress_bar = st.progress(0)
     data = []
-    for i, s in enumerate(symbols):
-        data.append(get_symbol_data(s))
-        progress_bar.progress((i + 1) / len(symbols))
-        time.sleep(0.5)  # Short delay to avoid rate limits
-    data = [d for d in data if d]  # Filter None
-    df = pd.DataFrame(data)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(get_symbol_data, s): s for s in symbols}
+        for i, future in enumerate(as_completed(futures)):
+            data.append(future.result())
+            progress_bar.progress((i + 1) / len(symbols))
+    for r in data:
+        if r and 'error' in r:
+            st.write(f"Error fetching data for {r['symbol']}: {r['error']}")  # Display error for debugging
+    data = [d for d in data if d and 'error' not in d]  # Filter skips and errors
+    if data:
+        # Struct-of-arrays: stack the raw series into (N, 240) matrices,
+        # run the batched regressions, then build the DataFrame once from
+        # ready-made float64 columns — no per-row dtype inference.
+        closes = np.stack([d['closes'] for d in data])
+        volumes = np.stack([d['volumes'] for d in data])
+        oi = np.stack([d['oi'] for d in data])
+        df = pd.DataFrame({
+            'symbol': [d['symbol'] for d in data],
+            'price': closes[:, -1].astype(np.float64),
+            'volume_4h': volumes.sum(axis=1, dtype=np.float64),
+            'oi_4h': oi[:, -1].astype(np.float64),
+            'pearson_r': batch_slope_r(closes, _XC_240, _SXX_240)[1],
+            'volume_slope_1h': batch_slope_r(volumes[:, -60:], _XC_60, _SXX_60)[0],
+            'volume_slope_4h': batch_slope_r(volumes, _XC_240, _SXX_240)[0],
+            'oi_slope_1h': batch_slope_r(oi[:, -60:], _XC_60, _SXX_60)[0],
+            'oi_slope_4h': batch_slope_r(oi, _XC_240, _SXX_240)[0],
+        })
+    else:
+        df = pd.DataFrame(data)
     st.session_state['df'] = df
 
 if 'df' in st.session_state:
@@ -105,20 +313,29 @@ if 'df' in st.session_state:
     min_oi_slope_4h = st.sidebar.number_input('Min OI Slope (4h)', value=0.0)
     selected_symbols = st.sidebar.multiselect('Select Symbols', df['symbol'].unique(), default=df['symbol'].unique())
 
-    # Apply filters
-    filtered_df = df[
-        (df['symbol'].isin(selected_symbols)) &
-        (df['pearson_r'] >= min_pearson_r) &
-        (df['volume_slope_1h'] >= min_volume_slope_1h) &
-        (df['volume_slope_4h'] >= min_volume_slope_4h) &
-        (df['oi_slope_1h'] >= min_oi_slope_1h) &
-        (df['oi_slope_4h'] >= min_oi_slope_4h)
-    ]
+    # Apply filters: one threshold comparison over a stacked (N, 5)
+    # array instead of five chained boolean Series
+    metrics = df[['pearson_r', 'volume_slope_1h', 'volume_slope_4h', 'oi_slope_1h', 'oi_slope_4h']].to_numpy()
+    thresholds = np.array([min_pearson_r, min_volume_slope_1h, min_volume_slope_4h, min_oi_slope_1h, min_oi_slope_4h])
+    mask = (metrics >= thresholds).all(axis=1) & df['symbol'].isin(selected_symbols).to_numpy()
+    filtered_df = df[mask]
 
     # Display table (sortable, alerts as highlighted rows)
     st.subheader('Screener Results')
     if not filtered_df.empty:
-        st.dataframe(filtered_df.style.highlight_max(axis=0, subset=['pearson_r', 'volume_slope_1h', 'volume_slope_4h', 'oi_slope_1h', 'oi_slope_4h'], color='lightgreen'))
+        metric_cols = ['pearson_r', 'volume_slope_1h', 'volume_slope_4h', 'oi_slope_1h', 'oi_slope_4h']
+        if len(filtered_df) <= 100:
+            # One argmax per column instead of Styler's per-cell max scan
+            vals = filtered_df[metric_cols].to_numpy()
+            mask = np.zeros(vals.shape, dtype=bool)
+            mask[vals.argmax(axis=0), np.arange(vals.shape[1])] = True
+            st.dataframe(filtered_df.style.apply(
+                lambda _: np.where(mask, 'background-color: lightgreen', ''),
+                axis=None, subset=metric_cols))
+        else:
+            # Styler cost scales with cell count — skip highlighting on
+            # big frames to keep the table render snappy
+            st.dataframe(filtered_df)
         st.success(f'{len(filtered_df)} symbols match filters/alerts!')
     else:
         st.warning('No matches.')
@@ -126,26 +343,9 @@ if 'df' in st.session_state:
     # Expandable charts
     st.subheader('Charts')
     for idx, row in filtered_df.iterrows():
-        if st.expander(f"View Chart for {row['symbol']}"):
-            # Fetch detailed 1m data for chart (24 hours = 1440 candles)
-            ohlcv = exchange.fetch_ohlcv(row['symbol'], '1m', limit=1440)
-            df_chart = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df_chart['timestamp'] = pd.to_datetime(df_chart['timestamp'], unit='ms')
-            oi = exchange.fetch_open_interest_history(row['symbol'], '1m', limit=1440)
-            df_chart['oi'] = [o['open_interest'] for o in oi]
-
-            # Plotly chart: Candlestick + volume/OI
-            fig = go.Figure()
-            fig.add_trace(go.Candlestick(x=df_chart['timestamp'], open=df_chart['open'], high=df_chart['high'], low=df_chart['low'], close=df_chart['close'], name='Price'))
-            fig.add_trace(go.Bar(x=df_chart['timestamp'], y=df_chart['volume'], name='Volume', yaxis='y2', opacity=0.5))
-            fig.add_trace(go.Scatter(x=df_chart['timestamp'], y=df_chart['oi'], name='OI', yaxis='y3', mode='lines'))
-            fig.update_layout(
-                title=f"{row['symbol']} Chart",
-                yaxis_title='Price',
-                yaxis2=dict(title='Volume', overlaying='y', side='right'),
-                yaxis3=dict(title='OI', overlaying='y', side='left', anchor='free', position=0.05),
-                xaxis_rangeslider_visible=True
-            )
-            st.plotly_chart(fig)
+        # `with`, not `if`: st.expander() is always truthy, so the old
+        # check fetched and rendered every chart on every rerun
+        with st.expander(f"View Chart for {row['symbol']}"):
+            st.plotly_chart(build_chart(row['symbol']))
 else:
-    st.info('Click "Refresh Data" to start scanning.')
+    st.info('Scanning starts automatically; click "Refresh Data" to force a rescan.')